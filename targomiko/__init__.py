@@ -1,2 +1,4 @@
+from .async_command import AsyncRemoteCommand
 from .command import RemoteCommand
 from .connection import SSHConnection
+from .pool import SSHConnectionPool
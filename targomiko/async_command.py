@@ -0,0 +1,154 @@
+import asyncio
+from typing import Callable, Optional
+
+from paramiko.channel import ChannelStdinFile, ChannelFile, ChannelStderrFile
+
+from .command import DEFAULT_CHUNK_SIZE, _POLL_INTERVAL
+
+
+class AsyncRemoteCommand:
+    """
+    AsyncRemoteCommand is the asyncio counterpart of the RemoteCommand. Instead of using a thread
+    per command, the output of all AsyncRemoteCommands is drained by the running event loop.
+    It is async-with-able and, just like the RemoteCommand, will be aborted upon exit of the
+    async-with-statement if it has not already exit.
+    Note that writing to stdin is not asynchronous and may block if the remote side does not consume its input.
+    """
+    def __init__(self, stdin: ChannelStdinFile, stdout: ChannelFile, stderr: ChannelStderrFile,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, on_done: Optional[Callable[[], None]] = None):
+        """
+        Takes over the IO of an already executed command. Must be called from within a running event loop.
+
+        :param stdin: The stdin pipe of the command.
+        :param stdout: The stdout pipe of the command.
+        :param stderr: The stderr pipe of the command.
+        :param chunk_size: Max. number of bytes received from the channel at once.
+        :param on_done: Optional callback, which is called exactly once as soon as the output has ended
+                        or the command is closed, whichever happens first.
+        """
+        self.stdin = stdin
+        self._stdout = stdout
+        self._stderr = stderr
+        self._channel = stdout.channel
+
+        self._chunk_size = chunk_size
+        self._on_done = on_done
+
+        # All buffers are only ever touched from within the event loop, so no locking is required.
+        self._stdout_buff = bytearray()
+        self._stderr_buff = bytearray()
+
+        self._exit_code: Optional[int] = None
+        self._has_exit = asyncio.Event()
+
+        self._loop = asyncio.get_running_loop()
+        self._fileno = self._channel.fileno()
+        self._reading = True
+        self._loop.add_reader(self._fileno, self._pump)
+        # The exit status does not signal the channel fileno, so it has to be polled.
+        self._poll_handle: Optional[asyncio.TimerHandle] = self._loop.call_later(_POLL_INTERVAL, self._poll)
+
+    def _pump(self):
+        channel = self._channel
+        exited = channel.exit_status_ready()
+        eof = channel.eof_received or channel.closed
+        self._drain(channel.recv_ready, channel.recv, self._stdout_buff)
+        self._drain(channel.recv_stderr_ready, channel.recv_stderr, self._stderr_buff)
+        if eof:
+            # After EOF the fileno stays signalled forever.
+            self._stop_reading()
+            self._done()
+        if exited and not self._has_exit.is_set():
+            self._exit_code = channel.recv_exit_status()
+            self._has_exit.set()
+
+    def _done(self):
+        if self._on_done is not None:
+            on_done, self._on_done = self._on_done, None
+            on_done()
+
+    def _drain(self, ready: Callable[[], bool], recv: Callable[[int], bytes], buff: bytearray):
+        while ready():
+            buff += recv(self._chunk_size)
+
+    def _poll(self):
+        self._pump()
+        if self._has_exit.is_set():
+            self._poll_handle = None
+        else:
+            self._poll_handle = self._loop.call_later(_POLL_INTERVAL, self._poll)
+
+    def _stop_reading(self):
+        if self._reading:
+            self._loop.remove_reader(self._fileno)
+            self._reading = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        """
+        Returns the exit_code of the command or None if the command is still running.
+        In case of a failure or an aborted command, -1 will be returned as paramiko does via
+        recv_exit_status.
+        :return: Exit code of the command or None if the command is still running.
+        """
+        if not self._has_exit.is_set():
+            return None
+        return self._exit_code
+
+    async def wait(self, timeout: Optional[float] = None) -> int:
+        """
+        Waits for the command to exit. Raises a TimeoutError if the timeout is reached
+        before the command has exit. The command will not be aborted automatically if this happens.
+        :param timeout: Timeout in (fractions of) seconds. Infinity if None.
+        :return: The exit code of the process.
+        """
+        try:
+            await asyncio.wait_for(self._has_exit.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("waiting for command exit timed out") from None
+        return self._exit_code
+
+    @property
+    def stdout(self) -> str:
+        """
+        Returns the asynchronously captured stdout.
+        :return: The captured stdout.
+        """
+        return self._stdout_buff.decode("utf-8", "replace")
+
+    @property
+    def stderr(self) -> str:
+        """
+        Returns the asynchronously captured stderr.
+        :return: The captured stderr.
+        """
+        return self._stderr_buff.decode("utf-8", "replace")
+
+    def close(self):
+        """
+        Closes the command, aborting it if it has not exit yet.
+        """
+        # The channel closes its fileno, so it has to be unregistered from the loop first.
+        self._stop_reading()
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+        try:
+            if not self.stdin.closed:
+                try:
+                    self.stdin.close()
+                finally:
+                    self.stdin.channel.close()
+            if not self._stdout.closed:
+                self._stdout.close()
+            if not self._stderr.closed:
+                self._stderr.close()
+            self._pump()
+        finally:
+            self._done()
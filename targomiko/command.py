@@ -1,70 +1,167 @@
+import codecs
+import io
+import queue
+import select
 import threading
-from typing import Optional
+from typing import Callable, Iterator, Optional, Tuple
 
 from paramiko.channel import ChannelStdinFile, ChannelFile, ChannelStderrFile
 
+DEFAULT_CHUNK_SIZE = 65536
+_POLL_INTERVAL = 0.1
+
+
+class _OutputBuffer:
+    """
+    Captures the output of one stream of a command in a single BytesIO. The decoded output is cached until
+    new output arrives. Once the output is consumed incrementally, all further chunks are additionally
+    handed to a queue.
+    """
+    def __init__(self):
+        self._buff = io.BytesIO()
+        self._size = 0
+        # The decoded output along with the number of bytes it was decoded from, replaced as a whole.
+        self._decoded: Tuple[int, str] = (0, "")
+        self._decode_lock = threading.Lock()
+        # Guards the hand-over between the BytesIO and the queue.
+        self._lock = threading.Lock()
+        self._closed = False
+        # Receives all chunks followed by None once the stream has ended. Only created for iter_lines.
+        self._queue: "Optional[queue.SimpleQueue[Optional[bytes]]]" = None
+
+    def append(self, chunk: bytes):
+        with self._lock:
+            self._buff.write(chunk)
+            self._size += len(chunk)
+            if self._queue is not None:
+                self._queue.put(chunk)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._queue is not None:
+                self._queue.put(None)
+
+    def getvalue(self) -> str:
+        size, decoded = self._decoded
+        if size == self._size:
+            return decoded
+        with self._decode_lock:
+            size, decoded = self._decoded
+            if size != self._size:
+                # The copy may already contain output appended after the size was checked, which is fine,
+                # as the cache is tagged with the size of the copy.
+                value = self._buff.getvalue()
+                decoded = value.decode("utf-8", "replace")
+                self._decoded = (len(value), decoded)
+            return decoded
+
+    def iter_lines(self) -> Iterator[str]:
+        with self._lock:
+            if self._queue is not None:
+                raise RuntimeError("the output can only be iterated once")
+            self._queue = queue.SimpleQueue()
+            # The output captured so far is handed over first.
+            self._queue.put(self._buff.getvalue())
+            if self._closed:
+                self._queue.put(None)
+        return self._lines(self._queue)
+
+    @staticmethod
+    def _lines(chunks: "queue.SimpleQueue[Optional[bytes]]") -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        pending = ""
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+            for line in lines:
+                yield line + "\n"
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending
+
 
 class RemoteCommand:
     """
     RemoteCommand wraps the IO pipes of a paramiko command. It is with-able and
-    uses threads to guarantee easy IO. Note that upon exit of the with-statement,
+    uses a background thread to guarantee easy IO. Note that upon exit of the with-statement,
     the RemoteCommand will be aborted if it has not already exit. Use the RemoteCommand.wait
     function to wait for the command exit. Note that if you do not catch the TimeoutError
     within the with-statement, the __exit__ call will cause an abortion of the command.
     """
-    def __init__(self, stdin: ChannelStdinFile, stdout: ChannelFile, stderr: ChannelStderrFile):
+    def __init__(self, stdin: ChannelStdinFile, stdout: ChannelFile, stderr: ChannelStderrFile,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, merge_output: bool = False,
+                 on_done: Optional[Callable[[], None]] = None):
+        """
+        Takes over the IO of an already executed command.
+
+        :param stdin: The stdin pipe of the command.
+        :param stdout: The stdout pipe of the command.
+        :param stderr: The stderr pipe of the command.
+        :param chunk_size: Max. number of bytes received from the channel at once.
+        :param merge_output: Must be True if the command runs in a pseudo terminal, in which case
+                             there is no separate stderr and all output is captured as stdout.
+        :param on_done: Optional callback, which is called exactly once as soon as the output has ended
+                        or the command is closed, whichever happens first.
+        """
         self.stdin = stdin
         self._stdout = stdout
         self._stderr = stderr
 
-        self._stdout_buff_lock = threading.Lock()
-        self._stdout_buff = ""
-        self._stderr_buff_lock = threading.Lock()
-        self._stderr_buff = ""
+        self._chunk_size = chunk_size
+        self._merge_output = merge_output
+        self._on_done = on_done
+        self._on_done_lock = threading.Lock()
 
-        self._stdout_consumer_ready = threading.Event()
-        self._stderr_consumer_ready = threading.Event()
+        self._stdout_buff = _OutputBuffer()
+        self._stderr_buff = _OutputBuffer()
 
-        self._stdout_consumer = threading.Thread(target=self._consume_stdout)
-        self._stderr_consumer = threading.Thread(target=self._consume_stderr)
-        self._stdout_consumer.start()
-        self._stderr_consumer.start()
+        # Set once all output received before the exit status has been captured.
+        self._exit_drained = threading.Event()
 
-        self._stdout_consumer_ready.wait()
-        self._stderr_consumer_ready.wait()
+        self._io_thread: Optional[threading.Thread] = None
+        self._start_io()
 
-        self._exit_code: Optional[int] = None
-        self._has_exit = threading.Event()
-        self._exit_listener = threading.Thread(target=self._wait)
-        self._exit_listener.start()
+    def _start_io(self):
+        self._io_thread = threading.Thread(target=self._run_io)
+        self._io_thread.start()
 
-    def _consume_stdout(self):
+    def _run_io(self):
+        channel = self._stdout.channel
         try:
-            self._stdout_consumer_ready.set()
             while True:
-                line = self._stdout.readline()
-                if not line:
+                # The channel fileno is signalled on new data as well as on EOF. The timeout is needed to
+                # notice the exit status and guards against the pipe being replaced by a concurrent close.
+                select.select([channel], [], [], _POLL_INTERVAL)
+                exited = channel.exit_status_ready()
+                eof = channel.eof_received or channel.closed
+                self._drain(channel.recv_ready, channel.recv, self._stdout_buff)
+                if not self._merge_output:
+                    self._drain(channel.recv_stderr_ready, channel.recv_stderr, self._stderr_buff)
+                if exited:
+                    self._exit_drained.set()
+                if eof:
                     break
-                with self._stdout_buff_lock:
-                    self._stdout_buff += line
         except:
-            return
+            pass
+        finally:
+            self._stdout_buff.close()
+            self._stderr_buff.close()
+            self._exit_drained.set()
+            self._done()
 
-    def _consume_stderr(self):
-        try:
-            self._stderr_consumer_ready.set()
-            while True:
-                line = self._stderr.readline()
-                if not line:
-                    break
-                with self._stderr_buff_lock:
-                    self._stderr_buff += line
-        except:
-            return
+    def _done(self):
+        # Called by the IO thread as well as by close.
+        with self._on_done_lock:
+            on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done()
 
-    def _wait(self):
-        self._exit_code = self._stdout.channel.recv_exit_status()
-        self._has_exit.set()
+    def _drain(self, ready: Callable[[], bool], recv: Callable[[int], bytes], buff: "_OutputBuffer"):
+        while ready():
+            buff.append(recv(self._chunk_size))
 
     def __enter__(self):
         return self
@@ -80,9 +177,10 @@ class RemoteCommand:
         recv_exit_status.
         :return: Exit code of the command or None if the command is still running.
         """
-        if not self._has_exit.is_set():
+        channel = self._stdout.channel
+        if not channel.exit_status_ready():
             return None
-        return self._exit_code
+        return channel.recv_exit_status()
 
     def wait(self, timeout: Optional[float] = None) -> int:
         """
@@ -91,40 +189,81 @@ class RemoteCommand:
         :param timeout: Timeout in (fractions of) seconds. Infinity if None.
         :return: The exit code of the process.
         """
-        self._has_exit.wait(timeout)
-        if self.exit_code is None:
+        channel = self._stdout.channel
+        if not channel.status_event.wait(timeout):
             raise TimeoutError("waiting for command exit timed out")
-        return self.exit_code
+        self._exit_drained.wait()
+        return channel.recv_exit_status()
 
     @property
     def stdout(self) -> str:
         """
-        Returns the asynchronously captured stdout.
+        Returns the asynchronously captured stdout. While the command is running, this is
+        a snapshot of the output captured so far.
         :return: The captured stdout.
         """
-        with self._stdout_buff_lock:
-            return self._stdout_buff
+        return self._stdout_buff.getvalue()
 
     @property
     def stderr(self) -> str:
         """
-        Returns the asynchronously captured stderr.
-        :return:
+        Returns the asynchronously captured stderr. While the command is running, this is
+        a snapshot of the output captured so far.
+        :return: The captured stderr.
+        """
+        return self._stderr_buff.getvalue()
+
+    def iter_stdout(self) -> Iterator[str]:
+        """
+        Yields the lines of stdout as they arrive until the stream ends, starting with the lines
+        captured so far. Lines include their trailing newline. Only a single iterator per stream
+        is supported, calling this again raises a RuntimeError.
+        :return: Iterator over the lines of stdout.
         """
-        with self._stderr_buff_lock:
-            return self._stderr_buff
+        return self._stdout_buff.iter_lines()
+
+    def iter_stderr(self) -> Iterator[str]:
+        """
+        Yields the lines of stderr as they arrive until the stream ends, starting with the lines
+        captured so far. Lines include their trailing newline. Only a single iterator per stream
+        is supported, calling this again raises a RuntimeError.
+        :return: Iterator over the lines of stderr.
+        """
+        return self._stderr_buff.iter_lines()
 
     def close(self):
         """
         Closes the command, aborting it if it has not exit yet.
         """
-        if not self.stdin.closed:
-            self.stdin.close()
-            self.stdin.channel.close()
-        if not self._stdout.closed:
-            self._stdout.close()
-        if not self._stderr.closed:
-            self._stderr.close()
-        self._stdout_consumer.join()
-        self._stderr_consumer.join()
-        self._exit_listener.join()
+        try:
+            if not self.stdin.closed:
+                try:
+                    self.stdin.close()
+                finally:
+                    self.stdin.channel.close()
+            if not self._stdout.closed:
+                self._stdout.close()
+            if not self._stderr.closed:
+                self._stderr.close()
+            if self._io_thread is not None:
+                self._io_thread.join()
+        finally:
+            self._done()
+
+
+class _NoCaptureRemoteCommand(RemoteCommand):
+    """
+    _NoCaptureRemoteCommand is used for commands whose output is discarded on the remote side.
+    As there is no output to be drained, its thread only waits for the command to exit.
+    """
+    def _start_io(self):
+        self._stdout_buff.close()
+        self._stderr_buff.close()
+        self._exit_drained.set()
+        self._io_thread = threading.Thread(target=self._wait_exit)
+        self._io_thread.start()
+
+    def _wait_exit(self):
+        # The status event is set on exit as well as once the channel is closed.
+        self._stdout.channel.status_event.wait()
+        self._done()
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import paramiko as paramiko
+
+
+def _is_active(client: paramiko.SSHClient) -> bool:
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+_CREDENTIALS = ("password", "passphrase", "key_filename", "pkey")
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_freeze(v) for v in value)
+    hash(value)
+    return value
+
+
+def pool_key(host: str, username: Optional[str], **options) -> Hashable:
+    """
+    Builds the key under which connections are pooled. Connections are only shared if they were
+    established to the same host as the same user with the same credentials and options.
+    The credentials are only kept as a fingerprint.
+
+    :param host: Hostname or IP of the connection.
+    :param username: Username used for login.
+    :param options: All other args the connection was established with, i.e. the credentials password,
+                    passphrase, key_filename and pkey, the args passed to paramiko.SSHClient.connect and
+                    settings applied to the connection afterwards.
+    :return: The pool key.
+    """
+    if options.get("sock") is not None:
+        raise ValueError("connections using a custom sock cannot be pooled")
+
+    fingerprint = hashlib.sha256()
+    for name in _CREDENTIALS:
+        value = options.pop(name, None)
+        if name == "key_filename" and value:
+            with open(value, "rb") as f:
+                value = f.read()
+        elif name == "pkey" and value is not None:
+            value = value.asbytes()
+        elif isinstance(value, str):
+            value = value.encode()
+        fingerprint.update(value or b"")
+        fingerprint.update(b"\0")
+
+    try:
+        options = _freeze(options)
+    except TypeError as e:
+        raise ValueError("connections using unhashable connect args cannot be pooled") from e
+    return host, username, fingerprint.hexdigest(), options
+
+
+class SSHConnectionPool:
+    """
+    SSHConnectionPool keeps connected paramiko.SSHClients around after an SSHConnection using the pool is
+    closed, such that later SSHConnections to the same host can skip the connection handshake.
+    The pool is thread-safe and with-able. Upon exit of the with-statement, all idle clients are closed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: Dict[Hashable, List[paramiko.SSHClient]] = {}
+
+    def acquire(self, key: Hashable, connect: Callable[[], paramiko.SSHClient]) -> paramiko.SSHClient:
+        """
+        Returns an idle client for the given key or connects a new one if there is none.
+        :param key: The pool key, see pool_key.
+        :param connect: Called to establish a new connection if no idle client is available.
+        :return: A connected client, which must be handed back via release.
+        """
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                client = idle.pop()
+                if _is_active(client):
+                    return client
+                client.close()
+        return connect()
+
+    def release(self, key: Hashable, client: paramiko.SSHClient):
+        """
+        Hands a client back to the pool. Clients which are no longer connected are closed instead.
+        :param key: The pool key the client was acquired with.
+        :param client: The client to hand back.
+        """
+        if not _is_active(client):
+            client.close()
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(client)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Closes all idle clients.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for clients in idle.values():
+            for client in clients:
+                client.close()